@@ -1,13 +1,19 @@
 from __future__ import annotations
 
-from hashlib import sha256
+import asyncio
+from collections.abc import Awaitable, Callable
+from hashlib import blake2b
+from types import UnionType
+from typing import Any, Union, get_args, get_origin
 from urllib.parse import urlparse, urlunparse
 
-from fastapi import APIRouter, HTTPException, Request
+import msgspec
+from fastapi import APIRouter, HTTPException, Request, Response
 from fastapi.responses import RedirectResponse
-from pydantic import BaseModel, ValidationError
+from pydantic import BaseModel
 
 from app.core import config, logger, ttl_cache
+from app.service import open115 as svc
 
 log = logger.get("api.file")
 router = APIRouter(prefix="/file", tags=["file"])
@@ -45,40 +51,140 @@ class PathInfo(BaseModel):
     iss: str | None = None
 
 
+# Resolve the ``FileInfo | list`` / ``PathInfo`` forward refs once at import
+# instead of lazily on the first request.
+FileInfoResponse.model_rebuild()
+
+
+def _matches(annotation: Any, value: Any) -> bool:
+    """Check whether a raw value fits one arm of a union annotation."""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return isinstance(value, dict) and all(
+            name in value
+            for name, field in annotation.model_fields.items()
+            if field.is_required()
+        )
+    origin = get_origin(annotation)
+    if annotation is list or origin is list:
+        return isinstance(value, list)
+    if annotation is dict or origin is dict:
+        return isinstance(value, dict)
+    return False
+
+
+def _construct_value(annotation: Any, value: Any) -> Any:
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel) and isinstance(value, dict):
+        return _fast_construct(annotation, value)
+    origin = get_origin(annotation)
+    if origin is Union or origin is UnionType:
+        for arm in get_args(annotation):
+            if _matches(arm, value):
+                return _construct_value(arm, value)
+        return value
+    if origin is list and isinstance(value, list):
+        args = get_args(annotation)
+        if args:
+            return [_construct_value(args[0], item) for item in value]
+        return value
+    if origin is dict and isinstance(value, dict):
+        args = get_args(annotation)
+        if len(args) == 2:
+            return {k: _construct_value(args[1], v) for k, v in value.items()}
+    return value
+
+
+def _fast_construct[ModelT: BaseModel](cls: type[ModelT], data: dict) -> ModelT:
+    """Build a model from trusted upstream JSON without pydantic validation.
+
+    The upstream payloads come from our own service layer, so the full
+    pydantic-core validation walk is skipped via ``model_construct``; nested
+    models and containers of models are constructed recursively. Never use
+    this for untrusted (client-supplied) input.
+    """
+    if not cls.__pydantic_complete__:
+        # Resolve forward refs (e.g. ``FileInfo | list``) once so field
+        # annotations are concrete types rather than ForwardRef strings.
+        cls.model_rebuild()
+    built = {
+        name: _construct_value(field.annotation, data[name])
+        for name, field in cls.model_fields.items()
+        if name in data
+    }
+    return cls.model_construct(**built)
+
+
+# Cache keys are namespaced raw strings; hashing them (formerly SHA-256) buys
+# nothing for a local SQLite TEXT primary key and costs 64 rounds per request.
 def _download_cache_key(path: str, ua: str) -> str:
-    raw_key = f"download:{path}|{ua}"
-    return sha256(raw_key.encode("utf-8")).hexdigest()
+    return f"download:{path}|{ua}"
 
 
 def _play_cache_key(path: str) -> str:
-    raw_key = f"play:{path}"
-    return sha256(raw_key.encode("utf-8")).hexdigest()
+    return f"play:{path}"
 
 
 def _file_info_cache_key(path: str) -> str:
-    raw_key = f"file-info:{path}"
-    return sha256(raw_key.encode("utf-8")).hexdigest()
+    return f"file-info:{path}"
+
+
+def _cache_headers(cache_key: str) -> dict[str, str]:
+    """HTTP cache hints so clients can replay the 302 without re-requesting.
+
+    The ETag is derived from the cache key, so it stays stable for as long
+    as the cached link would be reused server-side.
+    """
+    etag = blake2b(cache_key.encode("utf-8"), digest_size=16).hexdigest()
+    return {
+        "Cache-Control": f"private, max-age={config.link_cache_ttl_seconds}",
+        "ETag": f'"{etag}"',
+    }
+
+
+# Singleflight map: concurrent cache misses for the same key share one
+# upstream fetch instead of amplifying the request N-fold.
+_inflight: dict[str, asyncio.Future[str]] = {}
+_inflight_lock = asyncio.Lock()
+
+
+async def _singleflight(key: str, fetch: Callable[[], Awaitable[str]]) -> str:
+    """Run fetch() once per key; concurrent callers await the same result."""
+    async with _inflight_lock:
+        fut = _inflight.get(key)
+        is_leader = fut is None
+        if is_leader:
+            fut = asyncio.get_running_loop().create_future()
+            _inflight[key] = fut
+    if not is_leader:
+        return await fut
+    try:
+        fut.set_result(await fetch())
+    except Exception as e:
+        fut.set_exception(e)
+    finally:
+        if not fut.done():
+            # The leader was cancelled (e.g. client disconnect) before the
+            # future resolved; cancel it so followers don't await forever.
+            fut.cancel()
+        async with _inflight_lock:
+            _inflight.pop(key, None)
+    # The leader reads the future too, so a stored exception is always
+    # retrieved and re-raised for every caller.
+    return fut.result()
 
 
 @router.get("/info")
 async def get_file_info(path: str) -> FileInfo:
     """Get file/folder info by path from 115 service."""
-    try:
-        from app.service import open115 as svc
-    except Exception as e:  # pragma: no cover
-        log.exception("Failed to import app.service.open115: %s", e)
-        raise HTTPException(status_code=500, detail="Service unavailable") from e
-
     try:
         res = await svc.get_file_info_by_path(path)
     except Exception as e:
         log.error("Failed to get file info from upstream: %s", e)
         raise HTTPException(status_code=500, detail=str(e)) from e
     try:
-        res = FileInfoResponse.model_validate(res)
-    except ValidationError as e:
+        res = _fast_construct(FileInfoResponse, res)
+    except Exception as e:
         log.exception(
-            "Failed to get file info (upstream response validation error): %s", e
+            "Failed to get file info (malformed upstream response): %s", e
         )
         raise HTTPException(
             status_code=500,
@@ -98,7 +204,15 @@ async def get_file_info(path: str) -> FileInfo:
     return res.data
 
 
-class DownloadUrlInfo(BaseModel):
+# The download/play payloads never leave the server as JSON (the endpoints
+# redirect), so they are msgspec Structs decoded straight from the upstream
+# bytes — validation happens during decoding at a fraction of the cost of a
+# pydantic model. FileInfo stays pydantic because FastAPI serves it directly.
+class DownloadUrl(msgspec.Struct):
+    url: str
+
+
+class DownloadUrlInfo(msgspec.Struct):
     file_name: str
     file_size: int
     pick_code: str
@@ -106,91 +220,112 @@ class DownloadUrlInfo(BaseModel):
     url: DownloadUrl
 
 
-class DownloadUrl(BaseModel):
-    url: str
-
-
-class DownloadUrlResponse(BaseModel):
+class DownloadUrlResponse(msgspec.Struct):
     state: bool
     message: str
     code: int
     data: dict[str, DownloadUrlInfo] | list
 
 
-async def _get_file_info_cached(path: str) -> FileInfo:
+_download_url_decoder = msgspec.json.Decoder(DownloadUrlResponse)
+
+
+async def _get_file_info_cached(path: str, request: Request | None = None) -> FileInfo:
+    # Per-request memo: a handler that needs the info twice (e.g. via nested
+    # resolution) reuses the instance without touching the TTL cache. Each
+    # request resolves a single path, so the memo needs no key.
+    if request is not None:
+        info = getattr(request.state, "file_info", None)
+        if info is not None:
+            return info
     cache_key = _file_info_cache_key(path)
-    cached = ttl_cache.get(cache_key)
-    if cached:
-        return cached
-    info = await get_file_info(path)
-    ttl_cache.set(cache_key, info, config.link_cache_ttl_seconds)
+    info = await ttl_cache.aget(cache_key)
+    if info is None:
+        info = await get_file_info(path)
+        await ttl_cache.aset(cache_key, info, config.link_cache_ttl_seconds)
+    if request is not None:
+        request.state.file_info = info
     return info
 
 
-async def _resolve_download_url(path: str, request: Request) -> str:
-    """Resolve the direct download URL for a given path, with UA-aware caching.
+async def _resolve_download_url_from_pick_code(pick_code: str, ua: str) -> str:
+    """Fetch the direct download URL for an already-resolved pick code.
 
     Returns the URL as a string. Raises HTTPException on error.
     """
-    try:
-        from app.service import open115 as svc
-    except Exception as e:  # pragma: no cover
-        log.exception("Failed to import app.service.open115: %s", e)
-        raise HTTPException(status_code=500, detail="Service unavailable") from e
-
-    # Build cache key from path and User-Agent
-    ua = request.headers.get("User-Agent") or ""
-    key = _download_cache_key(path, ua)
-
-    # Check cache first
-    cached = ttl_cache.get(key)
-    if cached:
-        log.info("Cache hit for download url for path %s", path)
-        return cached
-
-    info = await _get_file_info_cached(path)
-    pick_code = info.pick_code
     try:
         result = await svc.get_download_url_by_pick_code(pick_code, ua=ua)
     except Exception as e:
         log.error("Failed to get download url from upstream: %s", e)
         raise HTTPException(status_code=500, detail=str(e)) from e
     try:
-        res = DownloadUrlResponse.model_validate(result)
-    except ValidationError as e:
+        res = _download_url_decoder.decode(result)
+    except (msgspec.DecodeError, msgspec.ValidationError) as e:
         log.exception(
-            "Failed to get download url (upstream response validation error): %s", e
+            "Failed to get download url (malformed upstream response): %s", e
         )
         raise HTTPException(
             status_code=500,
             detail={
                 "error": f"Invalid upstream response: {e}",
-                "origin_response": result,
+                "origin_response": result.decode("utf-8", errors="replace"),
             },
         ) from e
-    res_data_key = list(res.data.keys())[0]
-    download_url = res.data[res_data_key].url.url
+    # Dicts are insertion-ordered; grab the first entry without materializing
+    # a key list or re-indexing.
+    entry = next(iter(res.data.values()))
+    return entry.url.url
+
+
+async def _resolve_download_url(path: str, request: Request) -> str:
+    """Resolve the direct download URL for a given path, with UA-aware caching.
 
-    ttl_cache.set(key, download_url, config.link_cache_ttl_seconds)
-    return download_url
+    Returns the URL as a string. Raises HTTPException on error.
+    """
+    # Build cache key from path and User-Agent
+    ua = request.headers.get("User-Agent") or ""
+    key = _download_cache_key(path, ua)
+
+    # Check cache first
+    cached = await ttl_cache.aget_str(key)
+    if cached:
+        log.info("Cache hit for download url for path %s", path)
+        return cached
+
+    async def fetch() -> str:
+        info = await _get_file_info_cached(path, request)
+        download_url = await _resolve_download_url_from_pick_code(info.pick_code, ua)
+        await ttl_cache.aset_str(key, download_url, config.link_cache_ttl_seconds)
+        return download_url
+
+    return await _singleflight(key, fetch)
 
 
 @router.api_route("/download", methods=["GET", "HEAD"])
-async def redirect_to_download_link(path: str, request: Request, proxy: bool = False,) -> RedirectResponse:
+async def redirect_to_download_link(path: str, request: Request, proxy: bool = False,) -> Response:
     """Get download url for a file by file id from 115 service and redirect to it.
 
-    Adds a link cache keyed by a hash of request path and User-Agent.
+    Adds a link cache keyed by request path and User-Agent. Clients that
+    revalidate with If-None-Match get a 304 while the cached link is live.
     """
+    ua = request.headers.get("User-Agent") or ""
+    headers = _cache_headers(_download_cache_key(path, ua))
+    if request.headers.get("If-None-Match") == headers["ETag"]:
+        # Only short-circuit while the server-side cache still holds the
+        # link; the ETag is stable per key, so without this check a client
+        # could be told "unchanged" after the upstream URL rotated.
+        if await ttl_cache.aget_str(_download_cache_key(path, ua)) is not None:
+            return Response(status_code=304, headers=headers)
     download_url = await _resolve_download_url(path, request)
     if proxy:
         parsed = urlparse(download_url)
         proxy_download_url = urlunparse(parsed._replace(netloc=config.proxy_115cdn_host))
-        return RedirectResponse(url=proxy_download_url, status_code=302)
+        return RedirectResponse(url=proxy_download_url, status_code=302, headers=headers)
     log.info(f"Return download url for path {path}")
-    return RedirectResponse(url=download_url, status_code=302)
+    return RedirectResponse(url=download_url, status_code=302, headers=headers)
 
 
-class VideoUrlInfo(BaseModel):
+class VideoUrlInfo(msgspec.Struct):
     url: str
     height: int
     width: int
@@ -199,72 +334,87 @@ class VideoUrlInfo(BaseModel):
     definition_n: int
 
 
-class PlayUrlData(BaseModel):
+class PlayUrlData(msgspec.Struct):
     video_url: list[VideoUrlInfo]
 
-class PlayUnavailable(BaseModel):
-    video_push_state: bool
 
-class PlayUrlResponse(BaseModel):
+class PlayUrlResponse(msgspec.Struct):
+    # data carries either the video URL list or a {"video_push_state": ...}
+    # marker when play is unavailable; msgspec cannot decode untagged Struct
+    # unions, so it stays a dict and the handler converts the play branch.
     state: bool
     message: str
     code: int
-    data: PlayUrlData | PlayUnavailable | dict
+    data: dict
 
 
-@router.api_route("/play", methods=["GET", "HEAD"])
-async def redirect_to_play_link(path: str, request: Request) -> RedirectResponse:
-    """Get play url for a file by file id from 115 service and redirect to it.
+_play_url_decoder = msgspec.json.Decoder(PlayUrlResponse)
+
+
+async def _resolve_play_url(path: str, request: Request) -> str:
+    """Resolve the play URL for a path, with caching and request coalescing.
 
     If the play URL is unavailable, fall back to the direct download URL.
     """
-    try:
-        from app.service import open115 as svc
-    except Exception as e:  # pragma: no cover
-        log.exception("Failed to import app.service.open115: %s", e)
-        raise HTTPException(status_code=500, detail="Service unavailable") from e
-
     # try cache first (play cache is path-only)
     key = _play_cache_key(path)
-    cached = ttl_cache.get(key)
+    cached = await ttl_cache.aget_str(key)
     if cached:
-        return RedirectResponse(url=cached, status_code=302)
+        return cached
 
-    info = await _get_file_info_cached(path)
-    pick_code = info.pick_code
-    try:
-        result = await svc.get_play_url_by_pick_code(pick_code)
-    except Exception as e:
-        log.error("Failed to get play url from upstream: %s", e)
-        raise HTTPException(status_code=500, detail=str(e)) from e
-    try:
-        res = PlayUrlResponse.model_validate(result)
-    except ValidationError as e:
-        log.exception(
-            "Failed to get play url (upstream response validation error): %s", e
-        )
-        raise HTTPException(
-            status_code=500,
-            detail={
-                "error": f"Invalid upstream response: {e}",
-                "origin_response": result,
-            },
-        ) from e
+    async def fetch() -> str:
+        info = await _get_file_info_cached(path, request)
+        pick_code = info.pick_code
+        try:
+            result = await svc.get_play_url_by_pick_code(pick_code)
+        except Exception as e:
+            log.error("Failed to get play url from upstream: %s", e)
+            raise HTTPException(status_code=500, detail=str(e)) from e
+        try:
+            res = _play_url_decoder.decode(result)
+        except (msgspec.DecodeError, msgspec.ValidationError) as e:
+            log.exception(
+                "Failed to get play url (malformed upstream response): %s", e
+            )
+            raise HTTPException(
+                status_code=500,
+                detail={
+                    "error": f"Invalid upstream response: {e}",
+                    "origin_response": result.decode("utf-8", errors="replace"),
+                },
+            ) from e
+
+        # If play is unavailable -> fall back to direct download URL; the pick
+        # code is already resolved, so skip the extra file-info round-trip.
+        if "video_push_state" in res.data:
+            log.info(f"Play unavailable for path {path}; falling back to download URL")
+            ua = request.headers.get("User-Agent") or ""
+            download_url = await _resolve_download_url_from_pick_code(pick_code, ua)
+            # Cache play key with the download URL too, to speed up subsequent /play hits
+            await ttl_cache.aset_str(key, download_url, config.link_cache_ttl_seconds)
+            return download_url
+
+        # Otherwise, normal play flow
+        play_data = msgspec.convert(res.data, PlayUrlData)
+        video_url_info = play_data.video_url[-1]
+        video_url = video_url_info.url
+        if video_url.startswith("http://"):
+            # Single concat: keep the "://..." tail and swap the scheme.
+            video_url = "https" + video_url[4:]
+
+        await ttl_cache.aset_str(key, video_url, config.link_cache_ttl_seconds)
+        log.info(f"Return video url with tag {video_url_info.title} for path {path}")
+        return video_url
+
+    return await _singleflight(key, fetch)
+
+
+@router.api_route("/play", methods=["GET", "HEAD"])
+async def redirect_to_play_link(path: str, request: Request) -> RedirectResponse:
+    """Get play url for a file by file id from 115 service and redirect to it.
 
-    # If play is unavailable -> fall back to direct download URL
-    if isinstance(res.data, PlayUnavailable):
-        log.info(f"Play unavailable for path {path}; falling back to download URL")
-        download_url = await _resolve_download_url(path, request)
-        # Cache play key with the download URL too, to speed up subsequent /play hits
-        ttl_cache.set(key, download_url, config.link_cache_ttl_seconds)
-        return RedirectResponse(url=download_url, status_code=302)
-
-    # Otherwise, normal play flow
-    video_url_info = res.data.video_url[-1]
-    video_url = video_url_info.url
-    if video_url.startswith("http://"):
-        video_url = "https://" + video_url[len("http://") :]
-
-    ttl_cache.set(key, video_url, config.link_cache_ttl_seconds)
-    log.info(f"Return video url with tag {video_url_info.title} for path {path}")
-    return RedirectResponse(url=video_url, status_code=302)
+    If the play URL is unavailable, fall back to the direct download URL.
+    """
+    play_url = await _resolve_play_url(path, request)
+    headers = _cache_headers(_play_cache_key(path))
+    return RedirectResponse(url=play_url, status_code=302, headers=headers)
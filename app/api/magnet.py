@@ -2,10 +2,12 @@ from __future__ import annotations
 
 from typing import Literal
 
+import msgspec
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from pydantic import BaseModel, ConfigDict, Field
 
 from app.core import logger
+from app.service import open115 as svc
 
 log = logger.get("api.magnet")
 router = APIRouter(prefix="/magnet", tags=["file"])
@@ -20,39 +22,47 @@ class MagnetsRequest(BaseModel):
     dir_id: str = Field(..., description="115 dir id where tasks should be created")
 
 
-# Upstream response schemas
-class MagnetAddResult(BaseModel):
+# Upstream response schemas: msgspec Structs, validated in C during convert —
+# the envelope never leaves the server, only the per-result dicts below do.
+class MagnetAddResult(msgspec.Struct):
     state: bool
     code: int
     message: str
-    info_hash: str | None = None
     url: str
+    info_hash: str | None = None
 
 
-class MagnetAddEnvelope(BaseModel):
+class MagnetAddEnvelope(msgspec.Struct):
     state: bool
     message: str
     code: int
     data: list[MagnetAddResult]
 
 
-class MagnetAddResponse(MagnetAddResult):
+# Pydantic response model kept for the OpenAPI schema and response shape.
+class MagnetAddResponse(BaseModel):
+    state: bool
+    code: int
+    message: str
+    info_hash: str | None = None
+    url: str
     type: Literal["success", "duplicate", "failed"]
 
 
+# Classification of failed results by 115 error code; anything unlisted is a
+# plain failure. New codes only need a table entry, not new branch logic.
+_FAIL_CODE_TO_TYPE = {
+    10008: "duplicate",
+}
+
+
 @router.post("/add")
 async def add_magnets(payload: MagnetsRequest) -> list[MagnetAddResponse]:
     """Add offline download tasks by magnet links via 115 service."""
-    try:
-        from app.service import open115 as svc
-    except Exception as e:  # pragma: no cover - import-time failure surfaced as 500
-        log.exception("Failed to import app.service.open115: %s", e)
-        raise HTTPException(status_code=500, detail="Service unavailable") from e
-
     try:
         resj = await svc.add_magnets(payload.magnets, payload.dir_id)
-        envelope = MagnetAddEnvelope.model_validate(resj)
-    except ValidationError as e:
+        envelope = msgspec.convert(resj, MagnetAddEnvelope)
+    except msgspec.ValidationError as e:
         log.exception("Failed to add magnets (upstream response validation error): %s", e)
         raise HTTPException(
             status_code=400,
@@ -68,14 +78,10 @@ async def add_magnets(payload: MagnetsRequest) -> list[MagnetAddResponse]:
     if envelope.state is False:
         log.error("Failed to add magnets (error from 115): %s", envelope.message)
         raise HTTPException(status_code=500, detail=envelope.message)
-    response = []
-    for result in envelope.data:
-        result_dict = result.model_dump()
-        if result.state:
-            result_dict["type"] = "success"
-        elif result.code == 10008:
-            result_dict["type"] = "duplicate"
-        else:
-            result_dict["type"] = "failed"
-        response.append(result_dict)
-    return response
+    return [
+        {
+            **msgspec.structs.asdict(result),
+            "type": "success" if result.state else _FAIL_CODE_TO_TYPE.get(result.code, "failed"),
+        }
+        for result in envelope.data
+    ]
@@ -1,17 +1,66 @@
 from __future__ import annotations
 
+import asyncio
 import os
 import pickle
+import random
 import sqlite3
 import threading
 import time
+from collections import OrderedDict
+from collections.abc import Callable
 from pathlib import Path
 from typing import Any
 
+import msgspec
+
 from app.core import logger
 
 log = logger.get("core.cache")
 
+# Blob encoding: msgpack via msgspec for plain values (strings, dicts, ...),
+# which is an order of magnitude faster than pickle for the small URL strings
+# this cache mostly holds. Values msgspec cannot encode (e.g. pydantic models)
+# fall back to pickle; a one-byte tag records which codec was used.
+_TAG_MSGPACK = b"m"
+_TAG_PICKLE = b"p"
+
+
+def _encode_value(value: Any) -> bytes:
+    try:
+        return _TAG_MSGPACK + msgspec.msgpack.encode(value)
+    except TypeError:
+        return _TAG_PICKLE + pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _decode_value(blob: bytes) -> Any:
+    if blob[:1] == _TAG_MSGPACK:
+        return msgspec.msgpack.decode(blob[1:])
+    return pickle.loads(blob[1:])
+
+
+def _decode_str(blob: bytes) -> str:
+    return blob.decode("utf-8")
+
+
+# Hot statements as module constants: sqlite3 caches prepared statements per
+# connection keyed by the SQL string, so passing the same string object every
+# call guarantees the parse/plan step is skipped.
+_SQL_GET = "SELECT value, expires_at FROM cache WHERE key = ? AND expires_at > ?"
+_SQL_SET = """
+    INSERT INTO cache(key, value, expires_at)
+    VALUES(?, ?, ?)
+    ON CONFLICT(key) DO UPDATE SET
+        value=excluded.value,
+        expires_at=excluded.expires_at
+"""
+_SQL_DELETE = "DELETE FROM cache WHERE key = ?"
+_SQL_PURGE = "DELETE FROM cache WHERE expires_at <= ?"
+
+# Roughly one write in 256 triggers a purge of expired rows, amortizing the
+# cleanup cost instead of paying a DELETE on every read of a stale key.
+_SWEEP_PROBABILITY = 1 / 256
+
 
 def _resolve_db_path(db_path: str | Path | None) -> Path:
     if db_path is not None:
@@ -25,92 +74,216 @@ def _resolve_db_path(db_path: str | Path | None) -> Path:
 class SQLiteTTLCache:
     """Process-safe TTL cache backed by SQLite.
 
-    Values are pickled before storage to preserve types (e.g. Pydantic models).
-    The same database file can be shared across multiple uvicorn workers.
+    Values are serialized before storage (msgpack for plain values, pickle for
+    e.g. Pydantic models to preserve types). The same database file can be
+    shared across multiple uvicorn workers.
     """
 
+    # Clock seam: expiry comparisons go through this so tests can jump time
+    # forward instead of sleeping out real TTLs.
+    _now = staticmethod(time.time)
+
     def __init__(self, db_path: str | Path | None = None) -> None:
         self._path = _resolve_db_path(db_path)
         self._path.parent.mkdir(parents=True, exist_ok=True)
-        self._lock = threading.RLock()
-        self._conn = sqlite3.connect(
-            str(self._path),
-            timeout=10,
-            check_same_thread=False,
-            isolation_level=None,  # autocommit mode
+        # _lock guards the in-process mirror and the connection registry only.
+        # SQLite access itself goes through per-thread connections in WAL mode,
+        # so concurrent readers never contend on a Python-level lock.
+        self._lock = threading.Lock()
+        # In-process LRU mirror of hot entries so repeat hits skip the SQLite
+        # SELECT + decode entirely. Coherence with other connections is kept
+        # via PRAGMA data_version (see _sync_mem).
+        self._mem: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+        self._mem_cap = 1024
+        self._local = threading.local()
+        self._all_conns: list[sqlite3.Connection] = []
+        conn = self._conn()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
         )
-        with self._lock:
-            self._conn.execute("PRAGMA journal_mode=WAL")
-            self._conn.execute("PRAGMA synchronous=NORMAL")
-            self._conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS cache (
-                    key TEXT PRIMARY KEY,
-                    value BLOB NOT NULL,
-                    expires_at REAL NOT NULL
-                )
-                """
+        # Lets purge_expired delete by index range instead of a table scan.
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_exp ON cache(expires_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it lazily.
+
+        One connection per thread lets WAL-mode readers run concurrently
+        without serializing on a shared connection.
+        """
+        conn: sqlite3.Connection | None = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                str(self._path),
+                timeout=10,
+                check_same_thread=False,  # close() may run on another thread
+                isolation_level=None,  # autocommit mode
             )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # Wait out writer contention from sibling workers instead of
+            # surfacing SQLITE_BUSY, and keep sort/temp structures off disk.
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            self._local.conn = conn
+            self._local.cursor = conn.cursor()
+            self._local.data_version = self._query_data_version()
+            with self._lock:
+                self._all_conns.append(conn)
+        return conn
 
-    def get(self, key: str) -> Any | None:
-        now = time.time()
+    def _cursor(self) -> sqlite3.Cursor:
+        """Return this thread's long-lived cursor for the hot statements."""
+        self._conn()
+        return self._local.cursor
+
+    def _query_data_version(self) -> int:
+        return self._local.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _sync_mem(self) -> None:
+        """Drop the in-process mirror when another connection changed the DB.
+
+        PRAGMA data_version is a header read (no B-tree walk) and only changes
+        when a *different* connection writes, so repeat hits from the same
+        thread stay warm.
+        """
+        self._conn()
+        version = self._query_data_version()
+        if version != self._local.data_version:
+            with self._lock:
+                self._mem.clear()
+            self._local.data_version = version
+
+    def _mem_store(self, key: str, value: Any, expires_at: float) -> None:
+        if key not in self._mem and len(self._mem) >= self._mem_cap:
+            self._mem.popitem(last=False)
+        self._mem[key] = (value, expires_at)
+        self._mem.move_to_end(key)
+
+    def _get(self, key: str, decoder: Callable[[bytes], Any]) -> Any | None:
+        now = self._now()
+        self._sync_mem()
         with self._lock:
-            row = self._conn.execute(
-                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
-            ).fetchone()
+            entry = self._mem.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if now < expires_at:
+                    self._mem.move_to_end(key)
+                    return value
+                del self._mem[key]
+        # Expiry is filtered in SQL, so a stale row is just a miss here; the
+        # probabilistic sweep in _set reclaims the dead rows in batches.
+        row = self._cursor().execute(_SQL_GET, (key, now)).fetchone()
         if not row:
             return None
         value_blob, expires_at = row
-        if now >= expires_at:
-            self.delete(key)
-            return None
         try:
-            return pickle.loads(value_blob)
+            value = decoder(value_blob)
         except Exception as exc:  # pragma: no cover - defensive
-            log.exception("Failed to unpickle cache value for key=%s: %s", key, exc)
+            log.exception("Failed to decode cache value for key=%s: %s", key, exc)
             self.delete(key)
             return None
+        with self._lock:
+            self._mem_store(key, value, expires_at)
+        return value
 
-    def set(self, key: str, value: Any, ttl_seconds: int) -> None:
+    def _set(self, key: str, blob: bytes, value: Any, ttl_seconds: int) -> None:
         if ttl_seconds <= 0:
             self.delete(key)
             return
-        expires_at = time.time() + ttl_seconds
-        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        expires_at = self._now() + ttl_seconds
+        self._sync_mem()
+        self._cursor().execute(_SQL_SET, (key, blob, expires_at))
         with self._lock:
-            self._conn.execute(
-                """
-                INSERT INTO cache(key, value, expires_at)
-                VALUES(?, ?, ?)
-                ON CONFLICT(key) DO UPDATE SET
-                    value=excluded.value,
-                    expires_at=excluded.expires_at
-                """,
-                (key, sqlite3.Binary(blob), expires_at),
-            )
+            self._mem_store(key, value, expires_at)
+        if random.random() < _SWEEP_PROBABILITY:
+            self.purge_expired()
+
+    def get(self, key: str) -> Any | None:
+        return self._get(key, _decode_value)
+
+    def set(self, key: str, value: Any, ttl_seconds: int) -> None:
+        self._set(key, _encode_value(value), value, ttl_seconds)
+
+    def get_str(self, key: str) -> str | None:
+        """Fetch a value stored via set_str; skips the codec entirely."""
+        return self._get(key, _decode_str)
+
+    def set_str(self, key: str, value: str, ttl_seconds: int) -> None:
+        """Store a plain string as raw UTF-8 bytes, with no serialization.
+
+        The dominant cached value in this app is a single URL string;
+        encode/decode for those is just a UTF-8 pass.
+        """
+        self._set(key, value.encode("utf-8"), value, ttl_seconds)
+
+    # Async variants for use from request handlers: the SQLite query and
+    # decode run in the default executor so a cache miss never blocks the
+    # event loop.
+    async def aget(self, key: str) -> Any | None:
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, key)
+
+    async def aset(self, key: str, value: Any, ttl_seconds: int) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.set, key, value, ttl_seconds)
+
+    async def aget_str(self, key: str) -> str | None:
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_str, key)
+
+    async def aset_str(self, key: str, value: str, ttl_seconds: int) -> None:
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.set_str, key, value, ttl_seconds
+        )
 
     def delete(self, key: str) -> None:
+        self._cursor().execute(_SQL_DELETE, (key,))
         with self._lock:
-            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._mem.pop(key, None)
 
     def purge_expired(self) -> int:
-        now = time.time()
-        with self._lock:
-            cur = self._conn.execute(
-                "DELETE FROM cache WHERE expires_at <= ?", (now,)
-            )
-            removed = cur.rowcount or 0
+        now = self._now()
+        cur = self._cursor().execute(_SQL_PURGE, (now,))
+        removed = cur.rowcount or 0
         if removed:
             log.debug("Purged %d expired cache entries", removed)
         return removed
 
+    def maintain(self) -> int:
+        """Periodic housekeeping: purge expired rows and truncate the WAL.
+
+        Without this the cache table (and WAL file) grow without bound as
+        stale rows accumulate, deepening the B-tree every lookup walks.
+        """
+        removed = self.purge_expired()
+        self._conn().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return removed
+
     def clear(self) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM cache")
+        # A full wipe leaves the WAL at its high-water mark; truncate it so
+        # read latency doesn't inherit the pre-clear file size.
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
         with self._lock:
-            self._conn.execute("DELETE FROM cache")
+            self._mem.clear()
 
     def close(self) -> None:
         with self._lock:
-            self._conn.close()
+            conns, self._all_conns = self._all_conns, []
+            self._mem.clear()
+        self._local = threading.local()
+        for conn in conns:
+            # Let SQLite refresh stats/replan for the next process to open
+            # this file; cheap no-op when nothing changed.
+            try:
+                conn.execute("PRAGMA optimize")
+            except sqlite3.Error:  # pragma: no cover - defensive
+                pass
+            conn.close()
 
 
 # Module-level singleton for convenience/shared usage
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+from collections.abc import Awaitable, Callable
+
+import httpx
+
+from app.core import logger
+
+log = logger.get("http")
+
+# Pool limits sized for a proxy-style backend: too few slots makes requests
+# queue on the pool (and eventually trip the pool timeout + retries) under
+# concurrent load. Overridable via env for unusual deployments.
+HTTP_TIMEOUT = httpx.Timeout(connect=5.0, read=10.0, write=10.0, pool=10.0)
+HTTP_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("HTTPX_MAX_CONNECTIONS", "200")),
+    max_keepalive_connections=int(os.getenv("HTTPX_MAX_KEEPALIVE", "100")),
+    keepalive_expiry=float(os.getenv("HTTPX_KEEPALIVE_EXPIRY", "60")),
+)
+
+_client_lock = asyncio.Lock()
+_client: httpx.AsyncClient | None = None
+
+_logged_hosts: set[str] = set()
+
+
+async def _log_negotiated_protocol(response: httpx.Response) -> None:
+    # Log the ALPN outcome once per host so a silent downgrade to HTTP/1.1
+    # (losing stream multiplexing) is visible in the logs.
+    host = response.request.url.host
+    if host not in _logged_hosts:
+        _logged_hosts.add(host)
+        log.info("Negotiated %s with %s", response.http_version, host)
+
+
+async def get_http_client() -> httpx.AsyncClient:
+    """Return the shared pooled AsyncClient, creating it on first use.
+
+    A single HTTP/2 client serves every upstream (115 and Cloudflare), so
+    keep-alive connections and the TLS session cache are shared across all
+    call sites instead of being split over per-module pools.
+    """
+    global _client
+    if _client is None:
+        async with _client_lock:
+            if _client is None:
+                _client = httpx.AsyncClient(
+                    http2=True,
+                    timeout=HTTP_TIMEOUT,
+                    limits=HTTP_LIMITS,
+                    event_hooks={"response": [_log_negotiated_protocol]},
+                )
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def with_retry[T](
+    coro_fn: Callable[[], Awaitable[T]],
+    *,
+    attempts: int = 3,
+    base: float = 0.25,
+    cap: float = 10.0,
+) -> T:
+    """Run coro_fn, retrying transient httpx errors with multiplicative backoff.
+
+    Timeouts and HTTP status errors both subclass httpx.HTTPError, so a
+    failed raise_for_status inside coro_fn is retried like a network error.
+    """
+    for i in range(attempts):
+        try:
+            return await coro_fn()
+        except httpx.HTTPError:
+            if i == attempts - 1:
+                raise
+            await asyncio.sleep(min(cap, base * (1.5**i) + random.random() * 0.1))
+    raise AssertionError("unreachable")  # pragma: no cover
+
+
+__all__ = ["get_http_client", "close_http_client", "with_retry", "HTTP_TIMEOUT", "HTTP_LIMITS"]
@@ -51,6 +51,13 @@ def setup(level: int | str | None = None) -> None:
     numeric_level = _determine_level(level)
     root.setLevel(numeric_level)
 
+    # LOG_FORMAT uses none of the thread/process/caller fields, so skip
+    # collecting them (thread ident, pid, stack walk) on every record.
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    logging._srcfile = None
+
     formatter = logging.Formatter(fmt=LOG_FORMAT, datefmt=DATE_FORMAT)
 
     # Add console handler if not present
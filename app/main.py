@@ -1,26 +1,63 @@
-from contextlib import asynccontextmanager
+import asyncio
+import os
+from contextlib import asynccontextmanager, suppress
 
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 from app.api import file, magnet
+from app.core import ttl_cache
+from app.core.http import get_http_client
 from app.service import open115 as open115_service
 
+CACHE_MAINTENANCE_INTERVAL_SECONDS = 600
+
+_PREWARM_URLS = ("https://proapi.115.com/", "https://api.cloudflare.com/")
+
+
+async def _prewarm_connections() -> None:
+    # Pay DNS + TLS (+ ALPN) for the fixed upstream hosts once at startup so
+    # the first real request hits a warm keep-alive slot in the pool.
+    client = await get_http_client()
+    await asyncio.gather(
+        *(client.get(url, timeout=2.0) for url in _PREWARM_URLS),
+        return_exceptions=True,
+    )
+
+
+async def _cache_maintenance_loop() -> None:
+    # Purge expired cache rows and checkpoint the WAL periodically so the
+    # cache DB doesn't grow without bound.
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(CACHE_MAINTENANCE_INTERVAL_SECONDS)
+        await loop.run_in_executor(None, ttl_cache.maintain)
+
 
 # Lifespan to manage 115 tokens
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Ensure the token manager has populated the shared token store before serving traffic
     await open115_service.ensure_tokens_ready()
+    await _prewarm_connections()
+    maintenance = asyncio.create_task(_cache_maintenance_loop())
     try:
         yield
     finally:
+        maintenance.cancel()
+        with suppress(asyncio.CancelledError):
+            await maintenance
         await open115_service.shutdown()
 
 # Create FastAPI instance
 app = FastAPI(
-    title="Open115 API", description="A FastAPI backend for Open115", version="1.0.0", lifespan=lifespan
+    title="Open115 API",
+    description="A FastAPI backend for Open115",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,  # C-implemented JSON encoding
 )
 
 # Add CORS middleware
@@ -51,4 +88,13 @@ async def health_check():
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # The workload is pure I/O proxying, so the event loop is the critical
+    # path: uvloop + httptools cut per-request latency over asyncio + h11.
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
@@ -1,106 +1,88 @@
 from __future__ import annotations
 
 import asyncio
+import json
 import time
 
-import httpx
-from tenacity import (
-    AsyncRetrying,
-    retry_if_exception_type,
-    stop_after_attempt,
-    wait_exponential,
-)
+import orjson
 
 from app.core import config, logger
+from app.core.http import get_http_client as _get_client, with_retry as _with_retry
 
 log = logger.get("cloudflare")
 
 HTTP_NOT_FOUND = 404
 
-_client_lock = asyncio.Lock()
-_client: httpx.AsyncClient | None = None
-
-HTTP_TIMEOUT = httpx.Timeout(connect=5.0, read=10.0, write=10.0, pool=5.0)
-HTTP_LIMITS = httpx.Limits(max_connections=10, max_keepalive_connections=5)
+_TOKENS_KV_KEY = "115_tokens"
 
-_RETRY_KWARGS = dict(
-    stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=1, max=10),
-    retry=retry_if_exception_type((httpx.HTTPError, httpx.TimeoutException)),
-    reraise=True,
+# Account/namespace/token never change at runtime, so build the KV URL prefix
+# and headers once instead of per call.
+_KV_BASE = (
+    f"https://api.cloudflare.com/client/v4/accounts/{config.cf_account_id}"
+    f"/storage/kv/namespaces/{config.cf_kv_id}/values/"
 )
-
-
-def _retryer() -> AsyncRetrying:
-    return AsyncRetrying(**_RETRY_KWARGS)
-
-
-async def _get_client() -> httpx.AsyncClient:
-    global _client
-    if _client is None:
-        async with _client_lock:
-            if _client is None:
-                _client = httpx.AsyncClient(
-                    http2=True,
-                    timeout=HTTP_TIMEOUT,
-                    limits=HTTP_LIMITS,
-                )
-    return _client
+_KV_HEADERS = {
+    "Authorization": f"Bearer {config.cf_api_token}",
+    "Content-Type": "application/json",
+}
 
 
 async def get_kv_value(key: str) -> str:
-    url = (
-        f"https://api.cloudflare.com/client/v4/accounts/{config.cf_account_id}"
-        f"/storage/kv/namespaces/{config.cf_kv_id}/values/{key}"
-    )
-    headers = {
-        "Authorization": f"Bearer {config.cf_api_token}",
-        "Content-Type": "application/json",
-    }
+    url = _KV_BASE + key
+    client = await _get_client()
+
+    async def _get() -> str:
+        res = await client.get(url, headers=_KV_HEADERS)
+        if res.status_code == HTTP_NOT_FOUND:
+            msg = f"{key} not found in Cloudflare KV"
+            raise ValueError(msg)
+        res.raise_for_status()
+        return res.text.strip('"')
 
-    async for attempt in _retryer():
-        with attempt:
-            client = await _get_client()
-            res = await client.get(url, headers=headers)
-            if res.status_code == HTTP_NOT_FOUND:
-                msg = f"{key} not found in Cloudflare KV"
-                raise ValueError(msg)
-            res.raise_for_status()
-            return res.text.strip('"')
+    return await _with_retry(_get)
 
 
 async def put_kv_value(key: str, value: str) -> None:
-    url = (
-        f"https://api.cloudflare.com/client/v4/accounts/{config.cf_account_id}"
-        f"/storage/kv/namespaces/{config.cf_kv_id}/values/{key}"
-    )
-    headers = {
-        "Authorization": f"Bearer {config.cf_api_token}",
-        "Content-Type": "application/json",
-    }
+    url = _KV_BASE + key
+    client = await _get_client()
+
+    async def _put() -> None:
+        res = await client.put(url, headers=_KV_HEADERS, data=value)
+        res.raise_for_status()
 
-    async for attempt in _retryer():
-        with attempt:
-            client = await _get_client()
-            res = await client.put(url, headers=headers, data=value)
-            res.raise_for_status()
+    await _with_retry(_put)
 
 
 async def fetch_tokens() -> tuple[str, str, int]:
-    access_token, refresh_token, expires_at = await asyncio.gather(
-        get_kv_value("115_access_token"),
-        get_kv_value("115_refresh_token"),
-        get_kv_value("115_access_token_expires_at"),
-    )
-    return access_token, refresh_token, int(expires_at)
+    try:
+        blob = await get_kv_value(_TOKENS_KV_KEY)
+    except ValueError:
+        # Legacy layout: one KV key per field. Read it once, then write the
+        # merged blob back so subsequent fetches are a single round-trip.
+        access_token, refresh_token, expires_at = await asyncio.gather(
+            get_kv_value("115_access_token"),
+            get_kv_value("115_refresh_token"),
+            get_kv_value("115_access_token_expires_at"),
+        )
+        expires = int(expires_at)
+        await persist_tokens(access_token, refresh_token, expires)
+        return access_token, refresh_token, expires
+
+    data = json.loads(blob)
+    return data["access_token"], data["refresh_token"], int(data["expires_at"])
 
 
 async def persist_tokens(access_token: str, refresh_token: str, expires_at: int) -> None:
-    await asyncio.gather(
-        put_kv_value("115_access_token", access_token),
-        put_kv_value("115_refresh_token", refresh_token),
-        put_kv_value("115_access_token_expires_at", str(expires_at)),
+    # One atomic PUT instead of three: a refresh can no longer leave a torn
+    # state where access_token is updated but expires_at is not.
+    blob = json.dumps(
+        {
+            "access_token": access_token,
+            "refresh_token": refresh_token,
+            "expires_at": int(expires_at),
+        }
     )
+    await put_kv_value(_TOKENS_KV_KEY, blob)
 
 
 async def refresh_access_token(refresh_token: str) -> tuple[str, str, int]:
@@ -112,22 +94,23 @@ async def refresh_access_token(refresh_token: str) -> tuple[str, str, int]:
         "refresh_token": refresh_token,
     }
     log.info("Refreshing 115 access token via Cloudflare client")
-
-    async for attempt in _retryer():
-        with attempt:
-            client = await _get_client()
-            res = await client.post(url, headers=headers, data=payload)
-            res.raise_for_status()
-            resj = res.json()
-
-            if not bool(resj.get("state")):
-                msg = f"Failed to refresh 115 access token: {resj}"
-                raise RuntimeError(msg)
-
-            data = resj["data"]
-            expires_in = int(data["expires_in"])
-            expires_at = int(time.time() + expires_in)
-            access_token = data["access_token"]
-            new_refresh_token = data["refresh_token"]
-            log.info("Successfully refreshed 115 access token; expires_in=%s", expires_in)
-            return access_token, new_refresh_token, expires_at
+    client = await _get_client()
+
+    async def _post() -> tuple[str, str, int]:
+        res = await client.post(url, headers=headers, data=payload)
+        res.raise_for_status()
+        resj = orjson.loads(res.content)
+
+        if not bool(resj.get("state")):
+            msg = f"Failed to refresh 115 access token: {resj}"
+            raise RuntimeError(msg)
+
+        data = resj["data"]
+        expires_in = int(data["expires_in"])
+        expires_at = int(time.time() + expires_in)
+        access_token = data["access_token"]
+        new_refresh_token = data["refresh_token"]
+        log.info("Successfully refreshed 115 access token; expires_in=%s", expires_in)
+        return access_token, new_refresh_token, expires_at
+
+    return await _with_retry(_post)
@@ -4,61 +4,29 @@ import asyncio
 import os
 import threading
 import time
+from collections.abc import Mapping
+from types import MappingProxyType
 
 import httpx
-from tenacity import (
-    AsyncRetrying,
-    retry_if_exception_type,
-    stop_after_attempt,
-    wait_exponential,
-)
+import orjson
 
 from app.core import logger
+from app.core.http import (
+    close_http_client,
+    get_http_client as _get_client,
+    with_retry as _with_retry,
+)
 from app.service.token_store import TokenRecord, token_store
 
 log = logger.get("open115_service")
 
-_client_lock = asyncio.Lock()
-_client: httpx.AsyncClient | None = None
-
-HTTP_TIMEOUT = httpx.Timeout(connect=5.0, read=10.0, write=10.0, pool=5.0)
-HTTP_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10)
-
 _cache_lock = threading.RLock()
 _cached_record: TokenRecord | None = None
+# Preformatted, immutable Authorization headers kept in lockstep with
+# _cached_record so hot-path calls reuse one dict instead of reformatting.
+_cached_headers: Mapping[str, str] = MappingProxyType({})
 _REFRESH_THRESHOLD_SECONDS = int(os.getenv("OPEN115_REFRESH_THRESHOLD", "900"))
 
-_RETRY_KWARGS = dict(
-    stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=1, max=10),
-    retry=retry_if_exception_type((httpx.HTTPError, httpx.TimeoutException)),
-    reraise=True,
-)
-
-
-def _retryer() -> AsyncRetrying:
-    return AsyncRetrying(**_RETRY_KWARGS)
-
-
-async def _get_client() -> httpx.AsyncClient:
-    global _client
-    if _client is None:
-        async with _client_lock:
-            if _client is None:
-                _client = httpx.AsyncClient(
-                    http2=True,
-                    timeout=HTTP_TIMEOUT,
-                    limits=HTTP_LIMITS,
-                )
-    return _client
-
-
-async def _close_client() -> None:
-    global _client
-    if _client is not None:
-        await _client.aclose()
-        _client = None
-
 
 async def ensure_tokens_ready(timeout: float = 30.0, poll_interval: float = 0.25) -> None:
     loop = asyncio.get_running_loop()
@@ -70,7 +38,7 @@ async def ensure_tokens_ready(timeout: float = 30.0, poll_interval: float = 0.25
 
 
 def _refresh_cache(force: bool = False) -> TokenRecord:
-    global _cached_record
+    global _cached_record, _cached_headers
     now = time.time()
     with _cache_lock:
         if not force and _cached_record is not None:
@@ -82,93 +50,140 @@ def _refresh_cache(force: bool = False) -> TokenRecord:
         if not record:
             raise RuntimeError("115 tokens are not initialised in the token store")
         _cached_record = record
+        _cached_headers = MappingProxyType({"Authorization": "Bearer " + record.access_token})
         return record
 
 
-def get_access_token() -> str:
-    return _refresh_cache(force=False).access_token
+_refresh_async_lock = asyncio.Lock()
+_refresh_task: asyncio.Task[TokenRecord] | None = None
+_prefetch_in_flight = False
+_last_prefetch_at = 0.0
+# Minimum spacing between forced background reads: while the store still holds
+# the same near-expiry token, re-reading it once per interval is enough.
+_PREFETCH_INTERVAL_SECONDS = 60.0
+
+
+async def _do_refresh() -> TokenRecord:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, _refresh_cache)
+
+
+async def _prefetch_refresh() -> None:
+    global _prefetch_in_flight
+    try:
+        # force=True: the cached token is by construction still outside the
+        # refresh window here, so a plain refresh would return it without
+        # touching the store; the whole point is to read ahead of time.
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, _refresh_cache, True)
+    except Exception:  # pragma: no cover - best-effort background work
+        log.exception("Background token prefetch failed")
+    finally:
+        _prefetch_in_flight = False
+
+
+async def get_access_token() -> str:
+    global _prefetch_in_flight, _last_prefetch_at
+    # Lock-free fast path: a cached record that is safely outside the refresh
+    # window needs no store read and no lock.
+    record = _cached_record
+    now = time.time()
+    if record is not None and record.expires_at > now + _REFRESH_THRESHOLD_SECONDS:
+        # Approaching the refresh window: kick off a background refresh while
+        # the cached token is still valid, so no caller ever blocks on the
+        # store read once the threshold is actually crossed.
+        if (
+            record.expires_at - now < 2 * _REFRESH_THRESHOLD_SECONDS
+            and not _prefetch_in_flight
+            and now - _last_prefetch_at >= _PREFETCH_INTERVAL_SECONDS
+        ):
+            _prefetch_in_flight = True
+            _last_prefetch_at = now
+            asyncio.get_running_loop().create_task(_prefetch_refresh())
+        return record.access_token
+
+    # Slow path: coalesce concurrent callers onto a single refresh task so a
+    # thundering herd at the refresh boundary performs one store read, not N.
+    global _refresh_task
+    async with _refresh_async_lock:
+        if _refresh_task is None:
+            _refresh_task = asyncio.create_task(_do_refresh())
+        task = _refresh_task
+    try:
+        record = await task
+    finally:
+        async with _refresh_async_lock:
+            if _refresh_task is task:
+                _refresh_task = None
+    return record.access_token
+
+
+async def get_auth_headers() -> Mapping[str, str]:
+    """Return the frozen Authorization headers for the current access token."""
+    await get_access_token()
+    return _cached_headers
 
 
 def clear_token_cache() -> None:
-    global _cached_record
+    global _cached_record, _cached_headers, _last_prefetch_at
     with _cache_lock:
         _cached_record = None
+        _cached_headers = MappingProxyType({})
+        _last_prefetch_at = 0.0
+
+
+_115_BASE = "https://proapi.115.com"
+
+
+async def _call_115(
+    method: str,
+    path: str,
+    *,
+    data: dict | None = None,
+    params: dict | None = None,
+    ua: str | None = None,
+) -> httpx.Response:
+    """Perform one retry-wrapped, authenticated request against the 115 API."""
+    client = await _get_client()
+    headers = await get_auth_headers()
+    if ua:
+        headers = {**headers, "User-Agent": ua}
+
+    async def _send() -> httpx.Response:
+        res = await client.request(
+            method, _115_BASE + path, headers=headers, data=data, params=params
+        )
+        res.raise_for_status()
+        return res
+
+    return await _with_retry(_send)
 
 
 async def add_magnets(magnets: list[str], task_path_id: str) -> dict[str, list[str]]:
-    url = "https://proapi.115.com/open/offline/add_task_urls"
-
-    async for attempt in _retryer():
-        with attempt:
-            client = await _get_client()
-            headers = {
-                "Authorization": f"Bearer {get_access_token()}",
-            }
-            body = {
-                "urls": "\n".join(magnets),
-                "wp_path_id": task_path_id,
-            }
-            res = await client.post(url, headers=headers, data=body)
-            res.raise_for_status()
-            return res.json()
+    body = {
+        "urls": "\n".join(magnets),
+        "wp_path_id": task_path_id,
+    }
+    res = await _call_115("POST", "/open/offline/add_task_urls", data=body)
+    return orjson.loads(res.content)
 
 
 async def get_file_info_by_path(path: str) -> dict:
-    url = "https://proapi.115.com/open/folder/get_info"
-
-    async for attempt in _retryer():
-        with attempt:
-            client = await _get_client()
-            headers = {
-                "Authorization": f"Bearer {get_access_token()}",
-            }
-            body = {
-                "path": path,
-            }
-            res = await client.post(url, headers=headers, data=body)
-            res.raise_for_status()
-            return res.json()
-
-
-async def get_download_url_by_pick_code(
-    pick_code: str, ua: str | None = None
-) -> dict:
-    url = "https://proapi.115.com/open/ufile/downurl"
-
-    async for attempt in _retryer():
-        with attempt:
-            client = await _get_client()
-            headers = {
-                "Authorization": f"Bearer {get_access_token()}",
-            }
-            if ua:
-                headers["User-Agent"] = ua
-            body = {
-                "pick_code": pick_code,
-            }
-            res = await client.post(url, headers=headers, data=body)
-            res.raise_for_status()
-            return res.json()
-
-
-async def get_play_url_by_pick_code(pick_code: str, ua: str | None = None) -> dict:
-    url = "https://proapi.115.com/open/video/play"
-
-    async for attempt in _retryer():
-        with attempt:
-            client = await _get_client()
-            headers = {
-                "Authorization": f"Bearer {get_access_token()}",
-            }
-            if ua:
-                headers["User-Agent"] = ua
-            params = {
-                "pick_code": pick_code,
-            }
-            res = await client.get(url, headers=headers, params=params)
-            res.raise_for_status()
-            return res.json()
+    res = await _call_115("POST", "/open/folder/get_info", data={"path": path})
+    return orjson.loads(res.content)
+
+
+async def get_download_url_by_pick_code(pick_code: str, ua: str | None = None) -> bytes:
+    """Return the raw JSON bytes; the API layer decodes them via msgspec."""
+    res = await _call_115("POST", "/open/ufile/downurl", data={"pick_code": pick_code}, ua=ua)
+    return res.content
+
+
+async def get_play_url_by_pick_code(pick_code: str, ua: str | None = None) -> bytes:
+    """Return the raw JSON bytes; the API layer decodes them via msgspec."""
+    res = await _call_115("GET", "/open/video/play", params={"pick_code": pick_code}, ua=ua)
+    return res.content
 
 
 async def shutdown() -> None:
-    await _close_client()
+    await close_http_client()
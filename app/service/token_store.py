@@ -23,6 +23,24 @@ class TokenRecord:
         return self.expires_at - time.time()
 
 
+# Module-level SQL constants: sqlite3's per-connection statement cache is
+# keyed by the SQL string, so passing the same object guarantees the compiled
+# statement is reused instead of re-parsed per call.
+_SQL_UPSERT = """
+INSERT INTO tokens(id, access_token, refresh_token, expires_at, updated_at)
+VALUES(1, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    access_token = excluded.access_token,
+    refresh_token = excluded.refresh_token,
+    expires_at = excluded.expires_at,
+    updated_at = excluded.updated_at
+"""
+_SQL_SELECT = (
+    "SELECT access_token, refresh_token, expires_at, updated_at FROM tokens WHERE id = 1"
+)
+_SQL_DELETE = "DELETE FROM tokens WHERE id = 1"
+
+
 def _default_db_path() -> Path:
     env_path = os.getenv("OPEN115_TOKEN_DB")
     if env_path:
@@ -37,6 +55,16 @@ class TokenStore:
     def __init__(self, db_path: str | Path | None = None) -> None:
         self._path = Path(db_path) if db_path else _default_db_path()
         self._path.parent.mkdir(parents=True, exist_ok=True)
+        # Touched on every set_tokens so external processes can watch for
+        # readiness (inotify, `test -f`, ...) without opening the database.
+        self._ready_path = self._path.with_suffix(".ready")
+        # In-process waiters block on this instead of polling; a thread-safe
+        # Event because set_tokens may run on any thread. Cross-process
+        # writers are still caught by the bounded waits in wait_for_tokens.
+        self._ready_event = threading.Event()
+        # Bumped on every set_tokens; lets callers (the test fixtures) detect
+        # whether this process wrote anything without querying the DB.
+        self._generation = 0
         self._lock = threading.RLock()
         self._conn = sqlite3.connect(
             str(self._path),
@@ -47,6 +75,7 @@ class TokenStore:
         with self._lock:
             self._conn.execute("PRAGMA journal_mode=WAL")
             self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA cache_size=-2000")
             self._conn.execute(
                 """
                 CREATE TABLE IF NOT EXISTS tokens (
@@ -58,29 +87,20 @@ class TokenStore:
                 )
                 """
             )
+            self._cursor = self._conn.cursor()
 
     def set_tokens(self, access: str, refresh: str, expires_at: int) -> None:
         now = time.time()
         with self._lock:
-            self._conn.execute(
-                """
-                INSERT INTO tokens(id, access_token, refresh_token, expires_at, updated_at)
-                VALUES(1, ?, ?, ?, ?)
-                ON CONFLICT(id) DO UPDATE SET
-                    access_token = excluded.access_token,
-                    refresh_token = excluded.refresh_token,
-                    expires_at = excluded.expires_at,
-                    updated_at = excluded.updated_at
-                """,
-                (access, refresh, int(expires_at), now),
-            )
+            self._cursor.execute(_SQL_UPSERT, (access, refresh, int(expires_at), now))
+            self._generation += 1
+        self._ready_path.touch(exist_ok=True)
+        self._ready_event.set()
         log.debug("Token store updated; expires_at=%s", expires_at)
 
     def get_tokens(self) -> TokenRecord | None:
         with self._lock:
-            row = self._conn.execute(
-                "SELECT access_token, refresh_token, expires_at, updated_at FROM tokens WHERE id = 1"
-            ).fetchone()
+            row = self._cursor.execute(_SQL_SELECT).fetchone()
         if not row:
             return None
         access, refresh, expires_at, updated_at = row
@@ -91,19 +111,31 @@ class TokenStore:
             updated_at=float(updated_at),
         )
 
+    @property
+    def generation(self) -> int:
+        return self._generation
+
     def clear(self) -> None:
         with self._lock:
-            self._conn.execute("DELETE FROM tokens WHERE id = 1")
+            self._cursor.execute(_SQL_DELETE)
+        self._ready_event.clear()
+        self._ready_path.unlink(missing_ok=True)
 
     def wait_for_tokens(self, timeout: float = 30.0, poll_interval: float = 0.25) -> TokenRecord:
+        # An in-process set_tokens wakes us immediately via the event; a
+        # writer in another process is caught when the bounded wait times
+        # out, with the re-check interval backing off towards poll_interval.
         deadline = time.time() + timeout
+        delay = min(0.025, poll_interval)
         while True:
             record = self.get_tokens()
             if record:
                 return record
-            if time.time() >= deadline:
+            remaining = deadline - time.time()
+            if remaining <= 0:
                 raise TimeoutError("Token store not populated within timeout")
-            time.sleep(poll_interval)
+            self._ready_event.wait(min(delay, remaining))
+            delay = min(delay * 2, poll_interval)
 
     def close(self) -> None:
         with self._lock:
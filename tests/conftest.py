@@ -1,15 +1,57 @@
 from __future__ import annotations
 
+import asyncio
+import os
+from collections.abc import Callable
+
 import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Under pytest-xdist, give each worker its own SQLite files so parallel
+# workers never contend on the shared cache/token databases. Must happen
+# before any app import creates the module singletons.
+_worker = os.getenv("PYTEST_XDIST_WORKER")
+if _worker:
+    _tmp = os.getenv("TMPDIR", "/tmp")
+    os.environ.setdefault("OPEN115_CACHE_DB", f"{_tmp}/open115-cache-{_worker}.sqlite3")
+    os.environ.setdefault("OPEN115_TOKEN_DB", f"{_tmp}/open115-tokens-{_worker}.sqlite3")
+
+try:
+    import uvloop
+except ImportError:  # pragma: no cover - uvloop is a prod dependency
+    pass
+else:
+    # Same loop implementation the prod server runs on.
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+from app.service import open115  # noqa: E402
+from app.service.token_store import token_store  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client_factory() -> Callable[..., TestClient]:
+    """Session-wide TestClient builder so client construction policy
+    (redirect handling, base URL, ...) lives in one place."""
 
-from app.service import open115
-from app.service.token_store import token_store
+    def make(app: FastAPI, **kwargs) -> TestClient:
+        return TestClient(app, **kwargs)
+
+    return make
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _clean_token_store():
+    # One upfront wipe in case a previous run left tokens behind.
+    token_store.clear()
 
 
 @pytest.fixture(autouse=True)
 def clear_token_store():
-    token_store.clear()
     open115.clear_token_cache()
+    generation = token_store.generation
     yield
-    token_store.clear()
+    # Only pay the SQLite DELETE when the test actually wrote tokens.
+    if token_store.generation != generation:
+        token_store.clear()
     open115.clear_token_cache()
@@ -1,8 +1,12 @@
+import asyncio
+import json
 import time
+from functools import cache
 from typing import Any
 
 import pytest
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse
 from fastapi.testclient import TestClient
 
 from app.api import file as file_api
@@ -24,13 +28,45 @@ def clear_cache():
 
 
 def make_test_app() -> FastAPI:
-    app = FastAPI()
+    # Mirror app.main: orjson response encoding is part of the prod stack.
+    app = FastAPI(default_response_class=ORJSONResponse)
     app.include_router(file_api.router)
     return app
 
 
-def _mock_file_info(path: str) -> dict[str, Any]:
+@pytest.fixture(scope="module")
+def client(client_factory) -> TestClient:
+    # One app + client for the whole module; the autouse clear_cache fixture
+    # keeps tests isolated.
+    return client_factory(make_test_app(), follow_redirects=False)
+
+
+def _make_request(headers: dict[str, str]) -> Request:
+    # Minimal ASGI scope: the cache tests call the endpoint coroutine
+    # directly, skipping routing/middleware that they don't assert on.
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/file/download",
+        "query_string": b"",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+    }
+    return Request(scope)
+
+
+@cache
+def _mock_file_info_json(path: str) -> str:
     # Minimal valid structure matching FileInfoResponse
+    return json.dumps(_build_mock_file_info(path))
+
+
+def _mock_file_info(path: str) -> dict[str, Any]:
+    # Memoized via the frozen JSON form; each caller gets a fresh dict so a
+    # handler mutating its copy can't leak into other tests.
+    return json.loads(_mock_file_info_json(path))
+
+
+def _build_mock_file_info(path: str) -> dict[str, Any]:
     return {
         "state": True,
         "message": "ok",
@@ -56,31 +92,34 @@ def _mock_file_info(path: str) -> dict[str, Any]:
     }
 
 
-def _mock_download_response(url: str) -> dict[str, Any]:
-    return {
-        "state": True,
-        "message": "ok",
-        "code": 200,
-        "data": {
-            "PICKCODE": {
-                "file_name": "test.bin",
-                "file_size": 123,
-                "pick_code": "PICKCODE",
-                "sha1": "deadbeef",
-                "url": {"url": url},
-            }
-        },
-    }
-
-
-def test_download_uses_cache_on_second_request(monkeypatch):
-    # Arrange
-    app = make_test_app()
-    client = TestClient(app, follow_redirects=False)
-
+@cache
+def _mock_download_response(url: str) -> bytes:
+    # The service layer returns raw JSON bytes for download URLs; bytes are
+    # immutable so the memoized value can be shared freely.
+    return json.dumps(
+        {
+            "state": True,
+            "message": "ok",
+            "code": 200,
+            "data": {
+                "PICKCODE": {
+                    "file_name": "test.bin",
+                    "file_size": 123,
+                    "pick_code": "PICKCODE",
+                    "sha1": "deadbeef",
+                    "url": {"url": url},
+                }
+            },
+        }
+    ).encode("utf-8")
+
+
+@pytest.mark.asyncio
+async def test_download_uses_cache_on_second_request(monkeypatch):
     # Counters to verify upstream calls
     counters = {"info": 0, "download": 0}
 
+    from app.api import file as file_api
     from app.service import open115 as svc
 
     async def fake_get_file_info_by_path(path: str):
@@ -97,7 +136,7 @@ def test_download_uses_cache_on_second_request(monkeypatch):
     headers = {"User-Agent": "TestUA/1.0"}
 
     # Act - first request (cache miss)
-    r1 = client.get("/file/download", params={"path": "/a/b.bin"}, headers=headers)
+    r1 = await file_api.redirect_to_download_link("/a/b.bin", _make_request(headers))
     # Assert
     assert r1.status_code == 302
     assert r1.headers["location"] == "https://example.com/file.bin"
@@ -105,21 +144,20 @@ def test_download_uses_cache_on_second_request(monkeypatch):
     assert counters["download"] == 1
 
     # Act - second request (should be cache hit; no extra upstream download call)
-    r2 = client.get("/file/download", params={"path": "/a/b.bin"}, headers=headers)
+    r2 = await file_api.redirect_to_download_link("/a/b.bin", _make_request(headers))
     assert r2.status_code == 302
     assert r2.headers["location"] == "https://example.com/file.bin"
     assert counters["info"] == 1
     assert counters["download"] == 1
 
 
-def test_download_cache_expires(monkeypatch):
+@pytest.mark.asyncio
+async def test_download_cache_expires(monkeypatch):
     # Arrange - set a very small TTL: 2 seconds
     monkeypatch.setattr(config, "link_cache_ttl_seconds", 2)
 
-    app = make_test_app()
-    client = TestClient(app, follow_redirects=False)
-
     counters = {"download": 0}
+    from app.api import file as file_api
     from app.service import open115 as svc
 
     async def fake_get_file_info_by_path(path: str):
@@ -136,17 +174,150 @@ def test_download_cache_expires(monkeypatch):
     headers = {"User-Agent": "TestUA/2.0"}
 
     # First call -> miss
-    r1 = client.get("/file/download", params={"path": "/expire.bin"}, headers=headers)
+    r1 = await file_api.redirect_to_download_link("/expire.bin", _make_request(headers))
     assert r1.status_code == 302
     assert r1.headers["location"].endswith("file-1.bin")
 
     # Immediate second call -> hit (same URL)
-    r2 = client.get("/file/download", params={"path": "/expire.bin"}, headers=headers)
+    r2 = await file_api.redirect_to_download_link("/expire.bin", _make_request(headers))
     assert r2.status_code == 302
     assert r2.headers["location"].endswith("file-1.bin")
 
-    # After TTL -> should expire and fetch again
-    time.sleep(3)
-    r3 = client.get("/file/download", params={"path": "/expire.bin"}, headers=headers)
+    # After TTL -> should expire and fetch again; jump the cache clock
+    # forward instead of sleeping out the TTL in real time.
+    monkeypatch.setattr(ttl_cache, "_now", lambda: time.time() + 3)
+    r3 = await file_api.redirect_to_download_link("/expire.bin", _make_request(headers))
     assert r3.status_code == 302
     assert r3.headers["location"].endswith("file-2.bin")
+
+
+@pytest.mark.asyncio
+async def test_concurrent_download_misses_coalesce(monkeypatch):
+    counters = {"download": 0}
+
+    from app.api import file as file_api
+    from app.service import open115 as svc
+
+    async def fake_get_file_info_by_path(path: str):
+        return _mock_file_info(path)
+
+    async def fake_get_download_url_by_pick_code(pick_code: str, ua: str | None = None):
+        counters["download"] += 1
+        # Yield long enough for the second request to join the first's flight.
+        await asyncio.sleep(0.05)
+        return _mock_download_response("https://example.com/file.bin")
+
+    monkeypatch.setattr(svc, "get_file_info_by_path", fake_get_file_info_by_path)
+    monkeypatch.setattr(svc, "get_download_url_by_pick_code", fake_get_download_url_by_pick_code)
+
+    headers = {"User-Agent": "TestUA/5.0"}
+    r1, r2 = await asyncio.gather(
+        file_api.redirect_to_download_link("/burst.bin", _make_request(headers)),
+        file_api.redirect_to_download_link("/burst.bin", _make_request(headers)),
+    )
+
+    assert r1.status_code == 302
+    assert r2.status_code == 302
+    assert r1.headers["location"] == r2.headers["location"]
+    # Both cache misses shared one upstream fetch via the singleflight map.
+    assert counters["download"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_hang_followers(monkeypatch):
+    from app.api import file as file_api
+    from app.service import open115 as svc
+
+    fetch_started = asyncio.Event()
+
+    async def fake_get_file_info_by_path(path: str):
+        return _mock_file_info(path)
+
+    async def fake_get_download_url_by_pick_code(pick_code: str, ua: str | None = None):
+        fetch_started.set()
+        await asyncio.sleep(60)
+        return _mock_download_response("https://example.com/file.bin")
+
+    monkeypatch.setattr(svc, "get_file_info_by_path", fake_get_file_info_by_path)
+    monkeypatch.setattr(svc, "get_download_url_by_pick_code", fake_get_download_url_by_pick_code)
+
+    headers = {"User-Agent": "TestUA/6.0"}
+    leader = asyncio.create_task(
+        file_api.redirect_to_download_link("/cancel.bin", _make_request(headers))
+    )
+    await fetch_started.wait()
+    follower = asyncio.create_task(
+        file_api.redirect_to_download_link("/cancel.bin", _make_request(headers))
+    )
+    await asyncio.sleep(0.05)  # let the follower join the in-flight future
+
+    # Client disconnect: the server cancels the leader's handler.
+    leader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+    # The follower must be released promptly rather than awaiting forever.
+    with pytest.raises(asyncio.CancelledError):
+        await asyncio.wait_for(follower, timeout=1.0)
+
+
+@pytest.mark.asyncio
+async def test_download_revalidates_to_304_while_cached(monkeypatch):
+    counters = {"download": 0}
+
+    from app.api import file as file_api
+    from app.service import open115 as svc
+
+    async def fake_get_file_info_by_path(path: str):
+        return _mock_file_info(path)
+
+    async def fake_get_download_url_by_pick_code(pick_code: str, ua: str | None = None):
+        counters["download"] += 1
+        return _mock_download_response("https://example.com/file.bin")
+
+    monkeypatch.setattr(svc, "get_file_info_by_path", fake_get_file_info_by_path)
+    monkeypatch.setattr(svc, "get_download_url_by_pick_code", fake_get_download_url_by_pick_code)
+
+    headers = {"User-Agent": "TestUA/4.0"}
+
+    r1 = await file_api.redirect_to_download_link("/etag.bin", _make_request(headers))
+    assert r1.status_code == 302
+    etag = r1.headers["etag"]
+
+    # Revalidation with the ETag while the link is cached -> 304, no body,
+    # no extra upstream call.
+    revalidate = _make_request({**headers, "If-None-Match": etag})
+    r2 = await file_api.redirect_to_download_link("/etag.bin", revalidate)
+    assert r2.status_code == 304
+    assert counters["download"] == 1
+
+    # Once the cached link is gone the same ETag must not short-circuit.
+    ttl_cache.clear()
+    r3 = await file_api.redirect_to_download_link(
+        "/etag.bin", _make_request({**headers, "If-None-Match": etag})
+    )
+    assert r3.status_code == 302
+    assert counters["download"] == 2
+
+
+def test_download_endpoint_wiring(client, monkeypatch):
+    # One full-stack smoke test: routing, query parsing and the redirect all
+    # exercised through the ASGI pipeline.
+    from app.service import open115 as svc
+
+    async def fake_get_file_info_by_path(path: str):
+        return _mock_file_info(path)
+
+    async def fake_get_download_url_by_pick_code(pick_code: str, ua: str | None = None):
+        return _mock_download_response("https://example.com/file.bin")
+
+    monkeypatch.setattr(svc, "get_file_info_by_path", fake_get_file_info_by_path)
+    monkeypatch.setattr(svc, "get_download_url_by_pick_code", fake_get_download_url_by_pick_code)
+
+    r = client.get(
+        "/file/download",
+        params={"path": "/smoke.bin"},
+        headers={"User-Agent": "TestUA/3.0"},
+    )
+    assert r.status_code == 302
+    assert r.headers["location"] == "https://example.com/file.bin"
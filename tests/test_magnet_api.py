@@ -2,16 +2,20 @@ from __future__ import annotations
 
 import pytest
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.testclient import TestClient
 
 from app.api.magnet import router
 
 
-@pytest.fixture()
-def client() -> TestClient:
-    app = FastAPI()
+@pytest.fixture(scope="module")
+def client(client_factory) -> TestClient:
+    # App construction (router inclusion, route table build) is amortized
+    # across the module; per-test state lives in monkeypatches which reset
+    # themselves.
+    app = FastAPI(default_response_class=ORJSONResponse)
     app.include_router(router)
-    return TestClient(app)
+    return client_factory(app)
 
 
 def test_add_magnets_categorizes_results(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
@@ -20,7 +20,7 @@ async def test_ensure_tokens_ready_waits_for_store(monkeypatch: pytest.MonkeyPat
     asyncio.create_task(populate_store())
 
     await svc.ensure_tokens_ready(timeout=1.0, poll_interval=0.01)
-    assert svc.get_access_token() == "access"
+    assert await svc.get_access_token() == "access"
 
 
 @pytest.mark.asyncio
@@ -30,9 +30,7 @@ async def test_fetch_tokens_from_kv(monkeypatch: pytest.MonkeyPatch):
     async def fake_get_from_kv(key: str) -> str:
         calls[key] = calls.get(key, 0) + 1
         mapping = {
-            "115_access_token": "acc",
-            "115_refresh_token": "ref",
-            "115_access_token_expires_at": "1234",
+            "115_tokens": '{"access_token": "acc", "refresh_token": "ref", "expires_at": 1234}',
         }
         return mapping[key]
 
@@ -43,11 +41,42 @@ async def test_fetch_tokens_from_kv(monkeypatch: pytest.MonkeyPatch):
     assert access == "acc"
     assert refresh == "ref"
     assert expires == 1234
+    assert calls == {"115_tokens": 1}
+
+
+@pytest.mark.asyncio
+async def test_fetch_tokens_migrates_legacy_keys(monkeypatch: pytest.MonkeyPatch):
+    calls = {}
+    puts = {}
+
+    async def fake_get_from_kv(key: str) -> str:
+        calls[key] = calls.get(key, 0) + 1
+        mapping = {
+            "115_access_token": "acc",
+            "115_refresh_token": "ref",
+            "115_access_token_expires_at": "1234",
+        }
+        if key not in mapping:
+            raise ValueError(f"{key} not found in Cloudflare KV")
+        return mapping[key]
+
+    async def fake_put_to_kv(key: str, value: str) -> None:
+        puts[key] = value
+
+    monkeypatch.setattr(cloudflare, "get_kv_value", fake_get_from_kv)
+    monkeypatch.setattr(cloudflare, "put_kv_value", fake_put_to_kv)
+
+    access, refresh, expires = await cloudflare.fetch_tokens()
+
+    assert (access, refresh, expires) == ("acc", "ref", 1234)
     assert calls == {
+        "115_tokens": 1,
         "115_access_token": 1,
         "115_refresh_token": 1,
         "115_access_token_expires_at": 1,
     }
+    # Legacy values are merged and written back under the single blob key.
+    assert set(puts) == {"115_tokens"}
 
 
 @pytest.mark.asyncio
@@ -74,10 +103,51 @@ async def test_cached_token_reused_before_refresh_window(monkeypatch: pytest.Mon
     await svc.ensure_tokens_ready(timeout=1.0, poll_interval=0.01)
     assert calls["count"] == 2  # wait_for_tokens + forced refresh
 
-    assert svc.get_access_token() == "cached-token"
+    assert await svc.get_access_token() == "cached-token"
     assert calls["count"] == 2  # cache hit, no extra DB read
 
 
+@pytest.mark.asyncio
+async def test_prefetch_reads_store_before_refresh_window(monkeypatch: pytest.MonkeyPatch):
+    threshold = 900
+    monkeypatch.setattr(svc, "_REFRESH_THRESHOLD_SECONDS", threshold)
+    svc.clear_token_cache()
+
+    # Inside the prefetch band (threshold, 2*threshold): still served from
+    # cache, but close enough to expiry that a background read should fire.
+    expires_at = int(time.time()) + threshold + threshold // 2
+    token_store.set_tokens("prefetch-token", "refresh-token", expires_at)
+
+    calls = {"count": 0}
+    original_get = token_store.get_tokens
+
+    def wrapped_get_tokens():
+        calls["count"] += 1
+        return original_get()
+
+    monkeypatch.setattr(token_store, "get_tokens", wrapped_get_tokens)
+
+    await svc.ensure_tokens_ready(timeout=1.0, poll_interval=0.01)
+    assert calls["count"] == 2  # wait_for_tokens + forced refresh
+
+    # Fast path: the caller gets the cached token without blocking ...
+    assert await svc.get_access_token() == "prefetch-token"
+
+    # ... while the scheduled prefetch reads the store in the background,
+    # well before the threshold is actually crossed.
+    for _ in range(100):
+        if calls["count"] > 2:
+            break
+        await asyncio.sleep(0.01)
+    assert calls["count"] == 3
+
+    # The re-arm guard keeps further fast-path calls from forcing another
+    # store read until the prefetch interval has elapsed.
+    assert await svc.get_access_token() == "prefetch-token"
+    await asyncio.sleep(0.05)
+    assert calls["count"] == 3
+
+
 @pytest.mark.asyncio
 async def test_token_reloaded_when_within_refresh_window(monkeypatch: pytest.MonkeyPatch):
     threshold = 900
@@ -101,5 +171,5 @@ async def test_token_reloaded_when_within_refresh_window(monkeypatch: pytest.Mon
 
     token_store.set_tokens("new-token", "new-refresh", int(time.time()) + 3600)
 
-    assert svc.get_access_token() == "new-token"
+    assert await svc.get_access_token() == "new-token"
     assert calls["count"] == 3  # reload triggered due to refresh window